@@ -1,6 +1,30 @@
+import math
 import numpy as np
+from scipy.special import gammaln, xlogy
 from utils import DiscreteRandomVariable
 from numbers import Number
+from typing import Callable, Optional
+
+def _prefix_sums(values: np.ndarray) -> np.ndarray:
+    return np.concatenate(([0.0], np.cumsum(values)))
+
+
+def _suffix_sums(values: np.ndarray) -> np.ndarray:
+    return np.concatenate((np.cumsum(values[::-1])[::-1], [0.0]))
+
+
+def _expected_payoff(lattice: tuple[np.ndarray, ...], s0: Number, call: bool, strike: Number) -> float:
+    log_growth, _, prefix_probs, prefix_weighted, suffix_probs, suffix_weighted = lattice
+    if strike <= 0:
+        i = 0
+    elif s0 <= 0:
+        i = log_growth.shape[0]
+    else:
+        i = np.searchsorted(log_growth, math.log(strike / s0), side='right' if call else 'left')
+    if call:
+        return float(s0 * suffix_weighted[i] - strike * suffix_probs[i])
+    return float(strike * prefix_probs[i] - s0 * prefix_weighted[i])
+
 
 class BinomialModel():
 
@@ -11,28 +35,59 @@ class BinomialModel():
         self.s0 = s0
         self.risk_neutral = np.array([(1 + rate - d) / (u - d), (u - 1 - rate) / (u - d)])
         self.increment_risk_neutral = DiscreteRandomVariable(np.array([u, d]), self.risk_neutral)
+        self._p_star, self._q_star = self.risk_neutral
+        self._lattices = {}
+
+    def pick(self, rng: Optional[np.random.Generator]=None) -> np.array:
+        path = np.empty(self.periods + 1)
+        path[0] = self.s0
+        path[1:] = self.s0 * np.cumprod(self.increment.pick_many(self.periods, rng))
+        return path
+
+    def simulate_paths(self, n: int, rng: Optional[np.random.Generator]=None) -> np.ndarray:
+        paths = np.empty((n, self.periods + 1))
+        paths[:, 0] = self.s0
+        paths[:, 1:] = self.s0 * np.cumprod(self.increment.sample((n, self.periods), rng), axis=1)
+        return paths
+
+    def terminal_distribution(self) -> DiscreteRandomVariable:
+        log_growth, probs = self._lattice(self.periods)[:2]
+        return DiscreteRandomVariable(self.s0 * np.exp(log_growth), probs, 'S')
+
+    def _lattice(self, periods: int) -> tuple[np.ndarray, ...]:
+        if periods not in self._lattices:
+            d, u = self.increment_risk_neutral.domain
+            k = np.arange(periods + 1)
+            log_probs = gammaln(periods + 1) - gammaln(k + 1) - gammaln(periods - k + 1) \
+                + xlogy(k, self._p_star) + xlogy(periods - k, self._q_star)
+            log_growth = xlogy(k, u) + xlogy(periods - k, d)
+            probs, weighted_growth = np.exp(log_probs), np.exp(log_probs + log_growth)
+            self._lattices[periods] = log_growth, probs, \
+                _prefix_sums(probs), _prefix_sums(weighted_growth), \
+                _suffix_sums(probs), _suffix_sums(weighted_growth)
+        return self._lattices[periods]
+
+    def _discount(self, periods: int) -> float:
+        return math.exp(-periods * math.log1p(self.rate))
+
+    def _price(self, s0: Number, call: bool, strike: Number, periods: int) -> float:
+        payoff = _expected_payoff(self._lattice(periods), s0, call, strike)
+        return self._discount(periods) * payoff
+
+    def make_pricer(self) -> Callable[[bool, Number], float]:
+        lattice, s0 = self._lattice(self.periods), self.s0
+        discount = self._discount(self.periods)
 
-    def pick(self) -> np.array:
-        increments = np.array([self.s0])
-        for _ in range(self.periods):
-            x = self.increment.pick()
-            increments = np.append(increments, [increments[-1] * x])
-        return increments
+        def price(call: bool, strike: Number) -> float:
+            return discount * _expected_payoff(lattice, s0, call, strike)
+        return price
 
     def european_option_evaluate(self, call: bool, strike: Number) -> float:
-        if call:
-            payoff = lambda x: max(x - strike, 0)
-        else:
-            payoff = lambda x: max(strike - x, 0)
-        expectation = DiscreteRandomVariable([self.s0], [1])
-        for _ in range(self.periods):
-            expectation *= self.increment_risk_neutral
-        return expectation.transform(payoff).expectation() / ((1 + self.rate) ** self.periods)
+        return self._price(self.s0, call, strike, self.periods)
     
     def delta(self, call: bool, strike: Number) -> float:
         assert self.periods > 0, 'Option has already been expired'
-        u, d = self.increment.domain[1], self.increment.domain[0]
-        p, q = self.increment.probability[1], self.increment.probability[0]
-        option_up = type(self)(self.s0 * u, u, d, p, q, self.periods - 1).european_option_evaluate(call, strike)
-        option_down = type(self)(self.s0 * d, u, d, p, q, self.periods - 1).european_option_evaluate(call, strike)
+        d, u = self.increment.domain
+        option_up = self._price(self.s0 * u, call, strike, self.periods - 1)
+        option_down = self._price(self.s0 * d, call, strike, self.periods - 1)
         return (option_up - option_down) / (u - d) / self.s0
@@ -0,0 +1,59 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+# Optional kernel for utils._combine, build in place with: cythonize -i drv_kernels.pyx
+import numpy as np
+from libc.math cimport pow, rint
+from libc.stdlib cimport free, malloc, qsort
+
+
+cdef struct Pair:
+    double value
+    double weight
+
+
+cdef int _compare(const void* a, const void* b) noexcept nogil:
+    cdef double x = (<const Pair*>a).value
+    cdef double y = (<const Pair*>b).value
+    return (x > y) - (x < y)
+
+
+def combine(int op_id, const double[::1] a_dom, const double[::1] a_prob,
+            const double[::1] b_dom, const double[::1] b_prob, int precision):
+    cdef Py_ssize_t n = a_dom.shape[0], m = b_dom.shape[0], size = n * m
+    cdef Py_ssize_t i, j, k, count = 0
+    cdef double scale = pow(10.0, precision), value
+    cdef Pair* pairs = <Pair*>malloc(size * sizeof(Pair))
+    cdef double[::1] domain, probability
+    if pairs == NULL:
+        raise MemoryError()
+    try:
+        with nogil:
+            for i in range(n):
+                for j in range(m):
+                    if op_id == 0:
+                        value = a_dom[i] + b_dom[j]
+                    elif op_id == 1:
+                        value = a_dom[i] - b_dom[j]
+                    elif op_id == 2:
+                        value = a_dom[i] * b_dom[j]
+                    else:
+                        value = a_dom[i] / b_dom[j]
+                    pairs[i * m + j].value = rint(value * scale) / scale
+                    pairs[i * m + j].weight = a_prob[i] * b_prob[j]
+            qsort(pairs, size, sizeof(Pair), _compare)
+            for k in range(size):
+                if k == 0 or pairs[k].value != pairs[k - 1].value:
+                    count += 1
+        domain_arr, probability_arr = np.empty(count), np.empty(count)
+        domain, probability = domain_arr, probability_arr
+        with nogil:
+            i = -1
+            for k in range(size):
+                if k == 0 or pairs[k].value != pairs[k - 1].value:
+                    i += 1
+                    domain[i] = pairs[k].value
+                    probability[i] = pairs[k].weight
+                else:
+                    probability[i] += pairs[k].weight
+        return domain_arr, probability_arr
+    finally:
+        free(pairs)
@@ -1,27 +1,118 @@
+import os
 import numpy as np
 from typing import Optional, Union, Self, Callable, Iterable
 from numbers import Number
-from itertools import product
 import random
+from bisect import bisect_left
+
+# The numba kernel compiles on the first small product (seconds cold, ~0.5 s per process
+# with a warm cache), so it is only used when DRV_USE_NUMBA=1 is set.
+njit = None
+if os.environ.get('DRV_USE_NUMBA') == '1':
+    try:
+        from numba import njit
+    except ImportError:
+        pass
+
+try:
+    from drv_kernels import combine as _combine_cython
+except ImportError:
+    _combine_cython = None
+
+
+_OP_IDS = {np.add: 0, np.subtract: 1, np.multiply: 2, np.divide: 3}
+_KERNEL_MAX_PAIRS = 512
+
+
+def _combine_kernel(a_dom: np.ndarray, a_prob: np.ndarray, b_dom: np.ndarray, b_prob: np.ndarray,
+                    op_id: int, precision: int) -> tuple[np.ndarray, np.ndarray]:
+    n, m = a_dom.shape[0], b_dom.shape[0]
+    values, weights = np.empty(n * m), np.empty(n * m)
+    for i in range(n):
+        for j in range(m):
+            if op_id == 0:
+                value = a_dom[i] + b_dom[j]
+            elif op_id == 1:
+                value = a_dom[i] - b_dom[j]
+            elif op_id == 2:
+                value = a_dom[i] * b_dom[j]
+            else:
+                value = a_dom[i] / b_dom[j]
+            values[i * m + j] = round(value, precision)
+            weights[i * m + j] = a_prob[i] * b_prob[j]
+    order = np.argsort(values)
+    count = 0
+    for k in range(n * m):
+        if k == 0 or values[order[k]] != values[order[k - 1]]:
+            count += 1
+    domain, probability = np.empty(count), np.empty(count)
+    k = -1
+    for idx in order:
+        if k < 0 or values[idx] != domain[k]:
+            k += 1
+            domain[k] = values[idx]
+            probability[k] = weights[idx]
+        else:
+            probability[k] += weights[idx]
+    return domain, probability
+
+
+_combine_numba = njit(cache=True)(_combine_kernel) if njit is not None else None
+
+
+def _aggregate(values: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(values, kind='stable')
+    values, weights = values[order], weights[order]
+    boundaries = np.concatenate(([0], np.nonzero(np.diff(values))[0] + 1))
+    return values[boundaries], np.add.reduceat(weights, boundaries)
+
+
+def _combine(a_dom: np.ndarray, a_prob: np.ndarray, b_dom: np.ndarray, b_prob: np.ndarray,
+             op: np.ufunc, precision: int=5) -> tuple[np.ndarray, np.ndarray]:
+    if a_dom.shape[0] * b_dom.shape[0] <= _KERNEL_MAX_PAIRS:
+        if _combine_numba is not None:
+            return _combine_numba(a_dom, a_prob, b_dom, b_prob, _OP_IDS[op], precision)
+        if _combine_cython is not None:
+            return _combine_cython(_OP_IDS[op], np.ascontiguousarray(a_dom, dtype=np.float64),
+                                   np.ascontiguousarray(a_prob, dtype=np.float64),
+                                   np.ascontiguousarray(b_dom, dtype=np.float64),
+                                   np.ascontiguousarray(b_prob, dtype=np.float64), precision)
+    values = np.round(op.outer(a_dom, b_dom), precision).ravel()
+    weights = np.multiply.outer(a_prob, b_prob).ravel()
+    return _aggregate(values, weights)
 
 
 class DiscreteRandomVariable():
 
     def __init__(self, domain: Iterable[Number], weights: Optional[Iterable[Number]]=None, name: str='X'):
         assert isinstance(name, str), f'Only string names are accepted'
+        domain = np.asarray(domain, dtype=np.float64)
         if weights is None:
-            data = [[d, 1 / len(domain)] for i, d in enumerate(domain)]
+            probability = np.full(domain.shape[0], 1 / domain.shape[0])
         else:
             assert len(weights) == len(domain), \
                 f"Given domain size {len(domain)} doesn't match weights size {len(weights)}"
-            assert (w_sum := sum(weights)) > 0, f"Total weight of weights given must be positive"
-            weights = np.array(weights, dtype=float)
-            weights /= w_sum
-            data = [[d, weights[i]] for i, d in enumerate(domain)]
-        data.sort()
+            weights = np.asarray(weights, dtype=np.float64)
+            assert (w_sum := weights.sum()) > 0, f"Total weight of weights given must be positive"
+            probability = weights / w_sum
+        order = np.argsort(domain, kind='stable')
         self.name = name
-        self.domain = np.array([d[0] for d in data])
-        self.probability = np.array([d[1] for d in data])
+        self.domain = domain[order]
+        self.probability = probability[order]
+        self._cdf = np.cumsum(self.probability)
+        self._cdf_list = None
+        self._has_zero = bool(np.any(np.abs(self.domain) < 1e-12))
+    
+    @classmethod
+    def _from_sorted(cls, domain: np.ndarray, probability: np.ndarray, name: str='X') -> 'DiscreteRandomVariable':
+        obj = cls.__new__(cls)
+        obj.name = name
+        obj.domain = domain
+        obj.probability = probability
+        obj._cdf = np.cumsum(probability)
+        obj._cdf_list = None
+        obj._has_zero = bool(np.any(np.abs(domain) < 1e-12))
+        return obj
     
     def rename(self, name: str):
         assert isinstance(name, str), f'Only string names are accepted'
@@ -67,73 +158,97 @@ class DiscreteRandomVariable():
         result = self.__eq__(other)
         return NotImplemented if result is NotImplemented else not result
 
+    def _combine_drv(self, other: Self, op: np.ufunc, symbol: str) -> 'DiscreteRandomVariable':
+        domain, probability = _combine(self.domain, self.probability, \
+                                       other.domain, other.probability, op)
+        return DiscreteRandomVariable._from_sorted(domain, probability, symbol.join([self.name, other.name]))
+
     def __add__(self, other: Union[Self, Number]) -> 'DiscreteRandomVariable':
-        if isinstance(other, Number):
+        if type(other) is DiscreteRandomVariable or isinstance(other, type(self)):
+            return self._combine_drv(other, np.add, '+')
+        elif isinstance(other, Number):
             return DiscreteRandomVariable(self.domain + other, self.probability, \
                                           f'{self.name}+{other:.5f}')
-        elif isinstance(other, type(self)):
-            n, m = len(self.domain), len(other.domain)
-            values = {}
-            for i, j in product(range(n), range(m)):
-                new_val = round(self.domain[i] + other.domain[j], 5)
-                new_weight = self.probability[i] * other.probability[j]
-                values[new_val] = values.get(new_val, 0) + new_weight
-            return DiscreteRandomVariable(list(values.keys()), list(values.values()), \
-                                          '+'.join([self.name, other.name]))
     
     def __sub__(self, other: Union[Self, Number]) -> 'DiscreteRandomVariable':
-        if isinstance(other, Number):
+        if type(other) is DiscreteRandomVariable or isinstance(other, type(self)):
+            return self._combine_drv(other, np.subtract, '-')
+        elif isinstance(other, Number):
             return DiscreteRandomVariable(self.domain - other, self.probability, \
                                           f'{self.name}-{other:.5f}')
-        elif isinstance(other, type(self)):
-            n, m = len(self.domain), len(other.domain)
-            values = {}
-            for i, j in product(range(n), range(m)):
-                new_val = round(self.domain[i] - other.domain[j], 5)
-                new_weight = self.probability[i] * other.probability[j]
-                values[new_val] = values.get(new_val, 0) + new_weight
-            return DiscreteRandomVariable(list(values.keys()), list(values.values()), \
-                                          '-'.join([self.name, other.name]))
     
     def __mul__(self, other: Union[Self, Number]) -> 'DiscreteRandomVariable':
-        if isinstance(other, Number):
+        if type(other) is DiscreteRandomVariable or isinstance(other, type(self)):
+            return self._combine_drv(other, np.multiply, '*')
+        elif isinstance(other, Number):
             if (abs(other) < 1e-10):
                 return DiscreteRandomVariable([0], [1], f'{self.name}*0')
             else:
                 return DiscreteRandomVariable(self.domain * other, self.probability, \
                                               f'{self.name}*{other:.5f}')
-        elif isinstance(other, type(self)):
-            n, m = len(self.domain), len(other.domain)
-            values = {}
-            for i, j in product(range(n), range(m)):
-                new_val = round(self.domain[i] * other.domain[j], 5)
-                new_weight = self.probability[i] * other.probability[j]
-                values[new_val] = values.get(new_val, 0) + new_weight
-            return DiscreteRandomVariable(list(values.keys()), list(values.values()), \
-                                          '*'.join([self.name, other.name]))
+    
+    def __truediv__(self, other: Union[Self, Number]) -> 'DiscreteRandomVariable':
+        if type(other) is DiscreteRandomVariable or isinstance(other, type(self)):
+            if other._has_zero:
+                raise ZeroDivisionError(f'{other.name} takes zero value')
+            return self._combine_drv(other, np.divide, '/')
+        elif isinstance(other, Number):
+            if (abs(other) < 1e-10):
+                raise ZeroDivisionError(f'{self.name} divided by zero')
+            return DiscreteRandomVariable(self.domain / other, self.probability, \
+                                          f'{self.name}/{other:.5f}')
+    
+    def convolutional_power(self, n: int) -> 'DiscreteRandomVariable':
+        assert isinstance(n, int) and n >= 0, f'Only non-negative integer powers are supported'
+        name = f'{self.name}^{n}'
+        result, base = DiscreteRandomVariable([1], [1]), self
+        while n:
+            if n & 1:
+                result = result * base
+            n >>= 1
+            if n:
+                base = base * base
+        result.rename(name)
+        return result
     
     def transform(self, func: Optional[Callable]=lambda x: x, precision: Optional[int]=None) -> 'DiscreteRandomVariable':
-        values = {}
-        for i, d in enumerate(self.domain):
-            values[func(d)] = values.get(func(d), 0) + self.probability[i]
-        return DiscreteRandomVariable(list(values.keys()), list(values.values()), self.name)
+        values = np.round(self._evaluate(func), 10 if precision is None else precision)
+        return DiscreteRandomVariable._from_sorted(*_aggregate(values, self.probability), self.name)
         
-    def expectation(self, func: Optional[Callable]=lambda x: x, precision: Optional[int]=None) -> float:
-        result = sum([func(self.domain[i]) * self.probability[i] for i in range(len(self.domain))])
+    def _evaluate(self, func: Callable) -> np.ndarray:
+        try:
+            values = np.asarray(func(self.domain), dtype=np.float64)
+            if values.shape == self.domain.shape:
+                return values
+        except Exception:
+            pass
+        return np.array([func(d) for d in self.domain], dtype=np.float64)
+
+    def expectation(self, func: Optional[Callable]=None, precision: Optional[int]=None) -> float:
+        values = self.domain if func is None else self._evaluate(func)
+        result = float(values @ self.probability)
         if precision:
             return round(result, precision)
         else:
             return result
     
     def dispersion(self, precision: Optional[int]=None) -> float:
-        _exp = self.expectation()
-        func = lambda x: (x - _exp) ** 2
-        return self.expectation(func, precision)
+        result = float(((self.domain - self.expectation()) ** 2) @ self.probability)
+        if precision:
+            return round(result, precision)
+        else:
+            return result
 
     def pick(self) -> float:
-        threshold = random.uniform(0, 1)
-        i, w = 0, self.probability[0]
-        while (threshold > w):
-            i += 1
-            w += self.probability[i]
-        return self.domain[i]
+        if self._cdf_list is None:
+            self._cdf_list = self._cdf.tolist()
+        i = bisect_left(self._cdf_list, random.random())
+        return self.domain[min(i, len(self.domain) - 1)]
+
+    def pick_many(self, n: int, rng: Optional[np.random.Generator]=None) -> np.ndarray:
+        return self.sample(n, rng)
+
+    def sample(self, shape: Union[int, tuple[int, ...]], rng: Optional[np.random.Generator]=None) -> np.ndarray:
+        thresholds = np.random.random(shape) if rng is None else rng.random(shape)
+        indices = np.searchsorted(self._cdf, thresholds)
+        return self.domain[np.minimum(indices, len(self.domain) - 1)]